@@ -68,11 +68,7 @@ def start_training(
     )
     dset.prepare()
     project = AutoTrainProject(dataset=dset, job_params=jobs_df)
-    ids = project.create()
-    return gr.Markdown.update(
-        value=f"Training started for {len(ids)} jobs. You can view the status of your jobs at ids: {', '.join(ids)}",
-        visible=True,
-    )
+    return app_utils.start_project(project)
 
 
 def main():
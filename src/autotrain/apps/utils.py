@@ -8,6 +8,7 @@ import pandas as pd
 from huggingface_hub import list_models
 
 from autotrain import logger
+from autotrain.project import SpaceCreationError
 from autotrain.utils import user_authentication
 
 
@@ -26,6 +27,27 @@ BACKEND_CHOICES = {
 }
 
 
+def start_project(project):
+    """Creates the Spaces of an AutoTrainProject and returns the status message to display"""
+    try:
+        ids = project.create()
+    except SpaceCreationError as e:
+        failed_jobs = ", ".join(map(str, e.failed_jobs))
+        if len(e.created_spaces) == 0:
+            value = f"Failed to start training for all jobs ({failed_jobs}). Please check the logs and try again."
+        else:
+            value = (
+                f"Failed to start training for jobs: {failed_jobs}. "
+                f"Training started for {len(e.created_spaces)} jobs. "
+                f"You can view the status of your jobs at ids: {', '.join(e.created_spaces)}"
+            )
+        return gr.Markdown.update(value=value, visible=True)
+    return gr.Markdown.update(
+        value=f"Training started for {len(ids)} jobs. You can view the status of your jobs at ids: {', '.join(ids)}",
+        visible=True,
+    )
+
+
 def estimate_cost():
     pass
 
@@ -1,11 +1,15 @@
 import io
 import json
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
+from types import MappingProxyType
 from typing import Union
 
 import requests
-from huggingface_hub import HfApi
+from huggingface_hub import CommitOperationAdd, HfApi
+from huggingface_hub.utils import HfHubHTTPError
 
 from autotrain import logger
 from autotrain.dataset import AutoTrainDataset, AutoTrainDreamboothDataset
@@ -17,6 +21,62 @@ from autotrain.trainers.tabular.params import TabularParams
 from autotrain.trainers.text_classification.params import TextClassificationParams
 
 
+HUB_MAX_ATTEMPTS = 5
+
+
+def _call_hub(func, **kwargs):
+    """
+    Calls a HfApi method, retrying with exponential backoff on rate limiting (429), 503s and connection errors.
+    Only used for the calls made while creating a Space, other Hub traffic is left untouched.
+    """
+    for attempt in range(HUB_MAX_ATTEMPTS):
+        try:
+            return func(**kwargs)
+        except HfHubHTTPError as e:
+            if e.response is None or e.response.status_code not in (429, 503) or attempt == HUB_MAX_ATTEMPTS - 1:
+                raise
+            error = e
+        except requests.exceptions.ConnectionError as e:
+            if attempt == HUB_MAX_ATTEMPTS - 1:
+                raise
+            error = e
+        delay = 0.5 * 2**attempt
+        logger.warning(f"{func.__name__} failed ({error}), retrying in {delay}s")
+        time.sleep(delay)
+
+
+# shared by all SpaceRunners so that worker threads, and the keep-alive
+# connections huggingface_hub caches for them, are reused across Spaces
+_HUB_REQUESTS_POOL = ThreadPoolExecutor(max_workers=16)
+
+# SpaceRunner backend suffix -> Spaces hardware flavor
+SPACES_HARDWARE = MappingProxyType(
+    {
+        "a10gl": "a10g-large",
+        "a10gs": "a10g-small",
+        "a100": "a100-large",
+        "t4m": "t4-medium",
+        "t4s": "t4-small",
+        "cpu": "cpu-upgrade",
+        "cpuf": "cpu-basic",
+    }
+)
+
+SPACE_DOCKERFILE = b"FROM huggingface/autotrain-advanced:latest\nCMD autotrain api --port 7860 --host 0.0.0.0"
+
+SPACE_README_TEMPLATE = (
+    "---\n"
+    "title: {title}\n"
+    "emoji: 🚀\n"
+    "colorFrom: green\n"
+    "colorTo: indigo\n"
+    "sdk: docker\n"
+    "pinned: false\n"
+    "duplicated_from: autotrain-projects/autotrain-advanced\n"
+    "---\n"
+)
+
+
 def _tabular_munge_data(params, username):
     if isinstance(params.target_columns, str):
         col_map_label = [params.target_columns]
@@ -167,7 +227,7 @@ class EndpointsRunner:
                             "HF_TOKEN": self.params.token,
                             "AUTOTRAIN_USERNAME": self.username,
                             "PROJECT_NAME": self.params.project_name,
-                            "PARAMS": json.dumps(self.params.json()),
+                            "PARAMS": json.dumps(self.params.json(separators=(",", ":"))),
                             "DATA_PATH": self.params.data_path,
                             "TASK_ID": str(self.task_id),
                             "MODEL": self.params.model,
@@ -212,15 +272,6 @@ class SpaceRunner:
     backend: str
 
     def __post_init__(self):
-        self.spaces_backends = {
-            "a10gl": "a10g-large",
-            "a10gs": "a10g-small",
-            "a100": "a100-large",
-            "t4m": "t4-medium",
-            "t4s": "t4-small",
-            "cpu": "cpu-upgrade",
-            "cpuf": "cpu-basic",
-        }
         if not isinstance(self.params, GenericParams):
             if self.params.repo_id is not None:
                 self.username = self.params.repo_id.split("/")[0]
@@ -275,64 +326,62 @@ class SpaceRunner:
         raise NotImplementedError
 
     def _create_readme(self):
-        _readme = "---\n"
-        _readme += f"title: {self.params.project_name}\n"
-        _readme += "emoji: 🚀\n"
-        _readme += "colorFrom: green\n"
-        _readme += "colorTo: indigo\n"
-        _readme += "sdk: docker\n"
-        _readme += "pinned: false\n"
-        _readme += "duplicated_from: autotrain-projects/autotrain-advanced\n"
-        _readme += "---\n"
-        _readme = io.BytesIO(_readme.encode())
-        return _readme
-
-    def _add_secrets(self, api, repo_id):
+        return SPACE_README_TEMPLATE.format(title=self.params.project_name).encode()
+
+    def _get_secrets(self):
+        secrets = []
         if isinstance(self.params, GenericParams):
-            for k, v in self.params.env.items():
-                api.add_space_secret(repo_id=repo_id, key=k, value=v)
+            secrets.extend(self.params.env.items())
             self.params.env = {}
 
-        api.add_space_secret(repo_id=repo_id, key="HF_TOKEN", value=self.params.token)
-        api.add_space_secret(repo_id=repo_id, key="AUTOTRAIN_USERNAME", value=self.username)
-        api.add_space_secret(repo_id=repo_id, key="PROJECT_NAME", value=self.params.project_name)
-        api.add_space_secret(repo_id=repo_id, key="TASK_ID", value=str(self.task_id))
-        api.add_space_secret(repo_id=repo_id, key="PARAMS", value=json.dumps(self.params.json()))
+        secrets.append(("HF_TOKEN", self.params.token))
+        secrets.append(("AUTOTRAIN_USERNAME", self.username))
+        secrets.append(("PROJECT_NAME", self.params.project_name))
+        secrets.append(("TASK_ID", str(self.task_id)))
+        secrets.append(("PARAMS", json.dumps(self.params.json(separators=(",", ":")))))
 
         if isinstance(self.params, DreamBoothTrainingParams):
-            api.add_space_secret(repo_id=repo_id, key="DATA_PATH", value=self.params.image_path)
+            secrets.append(("DATA_PATH", self.params.image_path))
         else:
-            api.add_space_secret(repo_id=repo_id, key="DATA_PATH", value=self.params.data_path)
+            secrets.append(("DATA_PATH", self.params.data_path))
 
         if not isinstance(self.params, GenericParams):
-            api.add_space_secret(repo_id=repo_id, key="MODEL", value=self.params.model)
-            api.add_space_secret(repo_id=repo_id, key="OUTPUT_MODEL_REPO", value=self.params.repo_id)
+            secrets.append(("MODEL", self.params.model))
+            secrets.append(("OUTPUT_MODEL_REPO", self.params.repo_id))
+        return secrets
 
     def _create_space(self):
         api = HfApi(token=self.params.token)
         repo_id = f"{self.username}/autotrain-{self.params.project_name}"
-        api.create_repo(
+        _call_hub(
+            api.create_repo,
             repo_id=repo_id,
             repo_type="space",
             space_sdk="docker",
-            space_hardware=self.spaces_backends[self.backend.split("-")[1].lower()],
+            space_hardware=SPACES_HARDWARE[self.backend.split("-")[1].lower()],
             private=True,
         )
-        self._add_secrets(api, repo_id)
-        readme = self._create_readme()
-        api.upload_file(
-            path_or_fileobj=readme,
-            path_in_repo="README.md",
-            repo_id=repo_id,
-            repo_type="space",
-        )
+        try:
+            futures = [
+                _HUB_REQUESTS_POOL.submit(_call_hub, api.add_space_secret, repo_id=repo_id, key=k, value=v)
+                for k, v in self._get_secrets()
+            ]
+            for future in futures:
+                future.result()
 
-        _dockerfile = "FROM huggingface/autotrain-advanced:latest\nCMD autotrain api --port 7860 --host 0.0.0.0"
-        _dockerfile = io.BytesIO(_dockerfile.encode())
-        api.upload_file(
-            path_or_fileobj=_dockerfile,
-            path_in_repo="Dockerfile",
-            repo_id=repo_id,
-            repo_type="space",
-        )
+            # README and Dockerfile go in a single commit, the Dockerfile triggers the build
+            # so this only happens once all secrets are set
+            _call_hub(
+                api.create_commit,
+                repo_id=repo_id,
+                repo_type="space",
+                operations=[
+                    CommitOperationAdd(path_in_repo="README.md", path_or_fileobj=self._create_readme()),
+                    CommitOperationAdd(path_in_repo="Dockerfile", path_or_fileobj=SPACE_DOCKERFILE),
+                ],
+                commit_message="Initialize AutoTrain Space",
+            )
+        except Exception:
+            logger.error(f"Space {repo_id} was created but setting it up failed, please delete it before retrying")
+            raise
         return repo_id
@@ -8,5 +8,8 @@ AUTOTRAIN_BACKEND_API = os.getenv("AUTOTRAIN_BACKEND_API", "https://api.autotrai
 
 HF_API = os.getenv("HF_API", "https://huggingface.co")
 
+# set to "0" to skip codecarbon emissions tracking during local training
+AUTOTRAIN_TRACK_EMISSIONS = os.getenv("AUTOTRAIN_TRACK_EMISSIONS", "1") == "1"
+
 
 logger.configure(handlers=[dict(sink=sys.stderr, format="> <level>{level:<7} {message}</level>")])
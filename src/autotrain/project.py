@@ -2,16 +2,17 @@
 Copyright 2023 The HuggingFace Team
 """
 
-import json
+import importlib
 import os
 import time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
+from types import MappingProxyType
 from typing import Dict, List, Optional, Union
 
 import pandas as pd
-from codecarbon import EmissionsTracker
 
-from autotrain import logger
+from autotrain import config, logger
 from autotrain.backend import SpaceRunner
 from autotrain.dataset import AutoTrainDataset, AutoTrainDreamboothDataset, AutoTrainImageClassificationDataset
 from autotrain.languages import SUPPORTED_LANGUAGES
@@ -23,6 +24,57 @@ from autotrain.trainers.text_classification.params import TextClassificationPara
 from autotrain.utils import http_get, http_post
 
 
+TRAINING_TRACKER = os.path.join("/tmp", "training")
+
+# SUPPORTED_LANGUAGES is an ordered list for the UI, membership checks use a set
+_SUPPORTED_LANGUAGES = frozenset(SUPPORTED_LANGUAGES)
+
+# UI hardware choice -> SpaceRunner backend
+SPACES_BACKENDS = MappingProxyType(
+    {
+        "A10G Large": "spaces-a10gl",
+        "A10G Small": "spaces-a10gs",
+        "A100 Large": "spaces-a100",
+        "T4 Medium": "spaces-t4m",
+        "T4 Small": "spaces-t4s",
+        "CPU Upgrade": "spaces-cpu",
+        "CPU (Free)": "spaces-cpuf",
+        # "Local": "local",
+        # "AutoTrain": "autotrain",
+    }
+)
+
+# task id -> (module, function) of the trainer used by Project.create_local.
+# the text/image classification trainer modules are shadowed by the packages of the same name
+# and dreambooth has no payload based trainer, so those tasks are not supported locally.
+LOCAL_TRAINERS = MappingProxyType(
+    {
+        9: ("autotrain.trainers.lm_trainer", "train"),
+    }
+)
+
+
+class SpaceCreationError(Exception):
+    """Raised when some jobs' Spaces could not be created, keeps track of the ones that were"""
+
+    def __init__(self, created_spaces, failed_jobs):
+        self.created_spaces = created_spaces
+        self.failed_jobs = failed_jobs
+        super().__init__(
+            f"❌ Failed to create Spaces for jobs {failed_jobs}. Spaces created for the other jobs: {created_spaces}"
+        )
+
+
+class _NoopEmissionsTracker:
+    """Stands in for codecarbon's EmissionsTracker when emissions tracking is disabled"""
+
+    def start(self):
+        pass
+
+    def stop(self):
+        return None
+
+
 @dataclass
 class AutoTrainProject:
     dataset: Union[AutoTrainDataset, AutoTrainDreamboothDataset, AutoTrainImageClassificationDataset]
@@ -37,11 +89,12 @@ class AutoTrainProject:
             self.col_mapping = self.dataset.column_mapping
         self.data_path = f"{self.username}/autotrain-data-{self.project_name}"
 
-        self.backend = self.job_params.loc[0, "backend"]
+        _first_job = self.job_params.iloc[0]
+        self.backend = _first_job["backend"]
         if "model_choice" in self.job_params.columns:
-            self.model_choice = self.job_params.loc[0, "model_choice"]
+            self.model_choice = _first_job["model_choice"]
         if "param_choice" in self.job_params.columns:
-            self.param_choice = self.job_params.loc[0, "param_choice"]
+            self.param_choice = _first_job["param_choice"]
 
         self.task_id = TASKS.get(self.task)
         self.num_jobs = len(self.job_params)
@@ -58,23 +111,14 @@ class AutoTrainProject:
                 _tabular_target_cols = [f"autotrain_label_{i}" for i in range(len(self.col_mapping["label"]))]
             self.col_map_target = _tabular_target_cols
 
-        self.spaces_backends = {
-            "A10G Large": "spaces-a10gl",
-            "A10G Small": "spaces-a10gs",
-            "A100 Large": "spaces-a100",
-            "T4 Medium": "spaces-t4m",
-            "T4 Small": "spaces-t4s",
-            "CPU Upgrade": "spaces-cpu",
-            "CPU (Free)": "spaces-cpuf",
-            # "Local": "local",
-            # "AutoTrain": "autotrain",
-        }
-
-        self.job_params_json = self.job_params.to_json(orient="records")
-        logger.info(self.job_params_json)
+        # missing values become None, as they would after a to_json/json.loads round trip
+        self.job_params_records = (
+            self.job_params.astype(object).where(self.job_params.notna(), None).to_dict(orient="records")
+        )
+        logger.opt(lazy=True).info("{}", lambda: self.job_params_records)
 
     def _munge_common_params(self, job_idx):
-        _params = json.loads(self.job_params_json)[job_idx]
+        _params = dict(self.job_params_records[job_idx])
         _params["token"] = self.token
         _params["project_name"] = f"{self.project_name}-{job_idx}"
         _params["push_to_hub"] = True
@@ -148,29 +192,53 @@ class AutoTrainProject:
 
         return _params
 
+    def _build_job_params(self, job_idx):
+        if self.task_id == 9:
+            _params = self._munge_params_llm(job_idx)
+            _params = LLMTrainingParams.parse_obj(_params)
+        elif self.task_id in (1, 2):
+            _params = self._munge_params_text_clf(job_idx)
+            _params = TextClassificationParams.parse_obj(_params)
+        elif self.task_id in (13, 14, 15, 16, 26):
+            _params = self._munge_params_tabular(job_idx)
+            _params = TabularParams.parse_obj(_params)
+        elif self.task_id == 25:
+            _params = self._munge_params_dreambooth(job_idx)
+            _params = DreamBoothTrainingParams.parse_obj(_params)
+        else:
+            raise NotImplementedError
+        return _params
+
+    def _create_one_space(self, job_idx, params):
+        logger.info(f"Creating Space for job: {job_idx}")
+        logger.opt(lazy=True).info("Using params: {}", lambda: params)
+        sr = SpaceRunner(params=params, backend=SPACES_BACKENDS[self.backend])
+        space_id = sr.prepare()
+        logger.info(f"Space created with id: {space_id}")
+        return space_id
+
     def create_spaces(self):
+        # validate every job before launching anything, so a bad job can't leave the others' Spaces running
+        _jobs_params = [self._build_job_params(job_idx) for job_idx in range(self.num_jobs)]
+
+        # space creation is network bound, so jobs are dispatched concurrently
         _created_spaces = []
-        for job_idx in range(self.num_jobs):
-            if self.task_id == 9:
-                _params = self._munge_params_llm(job_idx)
-                _params = LLMTrainingParams.parse_obj(_params)
-            elif self.task_id in (1, 2):
-                _params = self._munge_params_text_clf(job_idx)
-                _params = TextClassificationParams.parse_obj(_params)
-            elif self.task_id in (13, 14, 15, 16, 26):
-                _params = self._munge_params_tabular(job_idx)
-                _params = TabularParams.parse_obj(_params)
-            elif self.task_id == 25:
-                _params = self._munge_params_dreambooth(job_idx)
-                _params = DreamBoothTrainingParams.parse_obj(_params)
-            else:
-                raise NotImplementedError
-            logger.info(f"Creating Space for job: {job_idx}")
-            logger.info(f"Using params: {_params}")
-            sr = SpaceRunner(params=_params, backend=self.spaces_backends[self.backend])
-            space_id = sr.prepare()
-            logger.info(f"Space created with id: {space_id}")
-            _created_spaces.append(space_id)
+        _failed_jobs = {}
+        with ThreadPoolExecutor(max_workers=min(16, max(self.num_jobs, 1))) as executor:
+            futures = [
+                executor.submit(self._create_one_space, job_idx, params) for job_idx, params in enumerate(_jobs_params)
+            ]
+            for job_idx, future in enumerate(futures):
+                # don't abort on the first failure, the other jobs' Spaces may already exist
+                try:
+                    _created_spaces.append(future.result())
+                except Exception as e:
+                    logger.error(f"Failed to create Space for job {job_idx}: {e}")
+                    _failed_jobs[job_idx] = e
+
+        if len(_failed_jobs) > 0:
+            first_error = _failed_jobs[min(_failed_jobs)]
+            raise SpaceCreationError(created_spaces=_created_spaces, failed_jobs=sorted(_failed_jobs)) from first_error
         return _created_spaces
 
     def create(self):
@@ -178,7 +246,7 @@ class AutoTrainProject:
             raise NotImplementedError
         if self.backend == "Local":
             raise NotImplementedError
-        if self.backend in self.spaces_backends:
+        if self.backend in SPACES_BACKENDS:
             return self.create_spaces()
 
 
@@ -208,7 +276,7 @@ class Project:
         logger.info(f"🚀 Using username: {self.username}")
         logger.info(f"🚀 Using param_choice: {self.param_choice}")
         logger.info(f"🚀 Using hub_model: {self.hub_model}")
-        logger.info(f"🚀 Using job_params: {self.job_params}")
+        logger.opt(lazy=True).info("🚀 Using job_params: {}", lambda: self.job_params)
 
         if self.token is None:
             raise ValueError("❌ Please login using `huggingface-cli login`")
@@ -242,75 +310,63 @@ class Project:
             self.max_models = len(self.job_params)
 
     def create_local(self, payload):
-        from autotrain.trainers.dreambooth import train_ui as train_dreambooth
-        from autotrain.trainers.image_classification import train as train_image_classification
-        from autotrain.trainers.lm_trainer import train as train_lm
-        from autotrain.trainers.text_classification import train as train_text_classification
+        if len(payload["config"]["params"]) > 1:
+            raise ValueError("❌ Only one job parameter is allowed in spaces/local mode.")
 
-        # check if training tracker file exists in /tmp/
-        if os.path.exists(os.path.join("/tmp", "training")):
+        if payload["task"] not in LOCAL_TRAINERS:
+            raise NotImplementedError
+
+        # create the training tracker file in /tmp/ atomically, failing if another job already holds it
+        try:
+            fd = os.open(TRAINING_TRACKER, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
             raise ValueError("❌ Another training job is already running in this workspace.")
 
-        if len(payload["config"]["params"]) > 1:
-            raise ValueError("❌ Only one job parameter is allowed in spaces/local mode.")
+        try:
+            os.write(fd, b"training")
 
-        model_path = os.path.join("/tmp/model", payload["proj_name"])
-        os.makedirs(model_path, exist_ok=True)
+            # only import the trainer that is needed, each of them pulls in a heavy stack.
+            # this happens after taking the tracker so a rejected job doesn't pay for it
+            module_name, func_name = LOCAL_TRAINERS[payload["task"]]
+            trainer = getattr(importlib.import_module(module_name), func_name)
 
-        co2_tracker = EmissionsTracker(save_to_file=False)
-        co2_tracker.start()
-        # create a training tracker file in /tmp/, using touch
-        with open(os.path.join("/tmp", "training"), "w") as f:
-            f.write("training")
+            model_path = os.path.join("/tmp/model", payload["proj_name"])
+            os.makedirs(model_path, exist_ok=True)
 
-        if payload["task"] in [1, 2]:
-            _ = train_text_classification(
-                co2_tracker=co2_tracker,
-                payload=payload,
-                huggingface_token=self.token,
-                model_path=model_path,
-            )
-        elif payload["task"] in [17, 18]:
-            _ = train_image_classification(
-                co2_tracker=co2_tracker,
-                payload=payload,
-                huggingface_token=self.token,
-                model_path=model_path,
-            )
-        elif payload["task"] == 25:
-            _ = train_dreambooth(
-                co2_tracker=co2_tracker,
-                payload=payload,
-                huggingface_token=self.token,
-                model_path=model_path,
-            )
-        elif payload["task"] == 9:
-            _ = train_lm(
+            if config.AUTOTRAIN_TRACK_EMISSIONS:
+                from codecarbon import EmissionsTracker
+
+                co2_tracker = EmissionsTracker(save_to_file=False)
+            else:
+                co2_tracker = _NoopEmissionsTracker()
+            co2_tracker.start()
+
+            _ = trainer(
                 co2_tracker=co2_tracker,
                 payload=payload,
                 huggingface_token=self.token,
                 model_path=model_path,
             )
-        else:
-            raise NotImplementedError
-
-        # remove the training tracker file in /tmp/, using rm
-        os.remove(os.path.join("/tmp", "training"))
+        finally:
+            # create_local is the only owner of the training tracker file, so it is always ours to remove
+            os.close(fd)
+            try:
+                os.remove(TRAINING_TRACKER)
+            except FileNotFoundError:
+                pass
 
     def create(self, local=False):
         """Create a project and return it"""
         logger.info(f"🚀 Creating project {self.name}, task: {self.task}")
         task_id = TASKS.get(self.task)
         if task_id is None:
-            raise ValueError(f"❌ Invalid task selected. Please choose one of {TASKS.keys()}")
+            raise ValueError(f"❌ Invalid task selected. Please choose one of {list(TASKS)}")
         language = str(self.language).strip().lower()
-        if task_id is None:
-            raise ValueError(f"❌ Invalid task specified. Please choose one of {list(TASKS.keys())}")
 
         if self.hub_model is not None:
             language = "unk"
 
-        if language not in SUPPORTED_LANGUAGES:
+        if language not in _SUPPORTED_LANGUAGES:
             raise ValueError("❌ Invalid language. Please check supported languages in AutoTrain documentation.")
 
         payload = {
@@ -326,12 +382,11 @@ class Project:
                 "params": self.job_params,
             },
         }
-        logger.info(f"🚀 Creating project with payload: {payload}")
+        logger.opt(lazy=True).info("🚀 Creating project with payload: {}", lambda: payload)
 
         if local is True:
             return self.create_local(payload=payload)
 
-        logger.info(f"🚀 Creating project with payload: {payload}")
         json_resp = http_post(path="/projects/create", payload=payload, token=self.token).json()
         proj_name = json_resp["proj_name"]
         proj_id = json_resp["id"]
@@ -349,18 +404,24 @@ class Project:
         ).json()
 
         logger.info("⏳ Waiting for data processing to complete ...")
-        is_data_processing_success = False
-        while is_data_processing_success is not True:
-            project_status = http_get(
+        delay = 0.25
+        while True:
+            response = http_get(
                 path=f"/projects/{project_id}",
                 token=self.token,
-            ).json()
+            )
             # See database.database.enums.ProjectStatus for definitions of `status`
-            if project_status["status"] == 3:
-                is_data_processing_success = True
+            if response.json()["status"] == 3:
                 logger.info("✅ Data processing complete!")
-
-            time.sleep(3)
+                break
+            # exponential backoff, unless the server tells us when to come back
+            try:
+                wait = float(response.headers.get("Retry-After", delay))
+            except ValueError:
+                # Retry-After can also be an HTTP date, fall back to our own backoff
+                wait = delay
+            time.sleep(max(0.25, min(wait, 60.0)))
+            delay = min(delay * 1.6, 10.0)
 
         logger.info(f"🚀 Approving project # {project_id}")
         # Approve training job
@@ -0,0 +1,50 @@
+import pandas as pd
+import pytest
+from pydantic import ValidationError
+
+from autotrain.backend import SpaceRunner
+from autotrain.project import AutoTrainProject, SpaceCreationError
+
+
+class DummyDataset:
+    token = "hf_token"
+    project_name = "proj"
+    username = "user"
+    task = "lm_training"
+
+
+def _llm_project(lrs):
+    jobs_df = pd.DataFrame([{"backend": "A10G Large", "model_choice": "gpt2", "lr": lr} for lr in lrs])
+    return AutoTrainProject(dataset=DummyDataset(), job_params=jobs_df)
+
+
+def test_create_spaces_validates_all_jobs_before_launching(monkeypatch):
+    prepared = []
+    monkeypatch.setattr(SpaceRunner, "prepare", lambda self: prepared.append(self.params.project_name))
+
+    project = _llm_project([3e-5, "not-a-number", 1e-4])
+    with pytest.raises(ValidationError):
+        project.create_spaces()
+    assert prepared == []
+
+
+def test_create_spaces_returns_ids_in_job_order(monkeypatch):
+    monkeypatch.setattr(SpaceRunner, "prepare", lambda self: f"user/autotrain-{self.params.project_name}")
+
+    project = _llm_project([3e-5, 1e-4, 2e-4])
+    assert project.create_spaces() == ["user/autotrain-proj-0", "user/autotrain-proj-1", "user/autotrain-proj-2"]
+
+
+def test_create_spaces_reports_partial_failure(monkeypatch):
+    def prepare(self):
+        if self.params.project_name == "proj-1":
+            raise ConnectionError("Hub unreachable")
+        return f"user/autotrain-{self.params.project_name}"
+
+    monkeypatch.setattr(SpaceRunner, "prepare", prepare)
+
+    project = _llm_project([3e-5, 1e-4, 2e-4])
+    with pytest.raises(SpaceCreationError) as excinfo:
+        project.create_spaces()
+    assert excinfo.value.failed_jobs == [1]
+    assert excinfo.value.created_spaces == ["user/autotrain-proj-0", "user/autotrain-proj-2"]
@@ -11,7 +11,9 @@ import requests
 from accelerate.state import PartialState
 from huggingface_hub import HfApi, HfFolder
 from huggingface_hub.repository import Repository
+from requests.adapters import HTTPAdapter
 from transformers import AutoConfig
+from urllib3.util.retry import Retry
 
 from autotrain import config, logger
 from autotrain.tasks import TASKS
@@ -43,6 +45,21 @@ LFS_PATTERNS = [
 ]
 
 
+# keep-alive session shared by http_get/http_post, so repeated calls (e.g. status polling)
+# reuse the TCP/TLS connection instead of opening a new one per request.
+# transient failures are retried for idempotent methods only, a retried POST could e.g. create a project twice
+_RETRY = Retry(
+    total=5,
+    backoff_factor=0.5,
+    status_forcelist=(429, 502, 503, 504),
+    respect_retry_after_header=True,
+    raise_on_status=False,
+)
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=8, pool_maxsize=16, max_retries=_RETRY))
+_SESSION.mount("http://", HTTPAdapter(pool_connections=8, pool_maxsize=16, max_retries=_RETRY))
+
+
 class UnauthenticatedError(Exception):
     pass
 
@@ -66,7 +83,7 @@ def http_get(
     """HTTP GET request to the AutoNLP API, raises UnreachableAPIError if the API cannot be reached"""
     logger.info(f"Sending GET request to {domain + path}")
     try:
-        response = requests.get(
+        response = _SESSION.get(
             url=domain + path, headers=get_auth_headers(token=token, prefix=token_prefix), **kwargs
         )
     except requests.exceptions.ConnectionError:
@@ -86,7 +103,7 @@ def http_post(
     """HTTP POST request to the AutoNLP API, raises UnreachableAPIError if the API cannot be reached"""
     logger.info(f"Sending POST request to {domain + path}")
     try:
-        response = requests.post(
+        response = _SESSION.post(
             url=domain + path, json=payload, headers=get_auth_headers(token=token), allow_redirects=True, **kwargs
         )
     except requests.exceptions.ConnectionError:
@@ -258,8 +275,6 @@ def job_watcher(func):
             logger.error(f"{func.__name__} has failed due to an exception:")
             logger.error(traceback.format_exc())
             co2_tracker.stop()
-            # delete training tracker file
-            os.remove(os.path.join("/tmp", "training"))
 
     return wrapper
 